@@ -1,16 +1,31 @@
 #!/usr/bin/env python3
 
+import heapq
 import sys
 from argparse import ArgumentParser
 from collections import Counter, namedtuple
-from io import BytesIO
-from json import dumps, loads
-from struct import pack, unpack
+from functools import lru_cache
+from struct import pack_into, unpack_from
+from typing import BinaryIO, Callable
+
+try:
+    # numpy is optional, it's only used to speed up compression
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    # numba is optional too, it compiles the bit loops when it's installed
+    from numba import njit
+except ImportError:
+    njit = None
 
 parser = ArgumentParser(
     description="Huffman compression, decompression and visualisation. "
     "Compression by default, decompression with -d and visualisation with -v. "
-    "Visualisation requires pydot and graphviz to be installed."
+    "Visualisation requires pydot and graphviz to be installed. "
+    "Compression is faster if numpy is installed, "
+    "and both ways are faster if numba is installed."
 )
 parser.add_argument(
     "infile", nargs="?", help="file to read input from, by default stdin"
@@ -32,7 +47,13 @@ parser.add_argument(
     "the tree is written to huffman_tree.png",
 )
 
-# container for letter and frequency
+# size of the buffer used when reading and writing files
+BUFFER_SIZE = 256 * 1024
+
+# size of the code lengths and number of bits at the start of compressed data
+HEADER_SIZE = 256 + 8
+
+# container for letter (a byte value from 0 to 255) and frequency
 Letter = namedtuple("Letter", ["char", "freq"])
 
 
@@ -41,32 +62,40 @@ class HuffmanException(Exception):
 
 
 class Node:
+    __slots__ = ("letter", "chars", "leftNode", "rightNode", "hasChildNodes")
+
     def __init__(self, letter: Letter) -> None:
         self.letter = letter
+        # the set of leaf characters under this node, used for fast membership checks
+        self.chars = (
+            frozenset((letter.char,)) if letter.char is not None else frozenset()
+        )
         self.leftNode = None
         self.rightNode = None
         self.hasChildNodes = False
 
-    def asDict(self) -> dict | str:
-        if self.hasChildNodes:
-            return {"0": self.leftNode.asDict(), "1": self.rightNode.asDict()}
-        else:
-            return self.letter.char
-
 
 def getName(node: Node) -> str:
-    return escape(node.letter.char) + "\n(" + str(node.letter.freq) + ")"
+    return escape(charsAsStr(node.chars)) + "\n(" + str(node.letter.freq) + ")"
+
+
+def charsAsStr(chars: frozenset[int]) -> str:
+    # show each byte as the character with the same code point
+    return "".join(map(chr, sorted(chars)))
+
+
+# escapes for characters that can't be used in graphviz names
+ESCAPE_TABLE = str.maketrans({"\n": "\\\\n", "\t": "\\\\t", "\r": "\\\\r"})
 
 
 def escape(s: str) -> str:
     # escape the names so they can be used in graphviz
-    s = s.replace("\n", "\\\\n").replace("\t", "\\\\t").replace("\r", "\\\\r")
-    return s
+    return s.translate(ESCAPE_TABLE)
 
 
-def makeTree(text: str, visualise: bool = False) -> Node:
+def makeTree(text: bytes, visualise: bool = False) -> Node:
     # make a list of Letter objects from the list of input characters
-    letters = list(map(Letter._make, Counter(text).most_common()))
+    letters = list(map(Letter._make, Counter(text).items()))
 
     # turn them all into singular nodes
     nodes = list(map(Node, letters))
@@ -79,46 +108,31 @@ def makeTree(text: str, visualise: bool = False) -> Node:
         graph.set_rankdir("BT")
 
     # if there is only one letter
-    # handle it separately
+    # the tree is just that letter, which gets a 1 bit code (see getCodeLengths)
     if len(nodes) == 1:
-        # make a root node that has the one letter
-        root = Node(nodes[0].letter)
-        root.hasChildNodes = True
-        # make the left node the one letter
-        root.leftNode = nodes[0]
-        # make the right node empty
-        root.rightNode = Node(Letter("", 0))
-        # now root looks like this (if a is the only letter):
-        #   root
-        #   /  \
-        #  a    empty
-        nodes = [root]
-
-        # add it to the graph
         if visualise:
-            # here we have to add spaces to distinguish the root node and the one letter node
-            name = escape(root.letter.char) + "\n (" + str(root.letter.freq) + ") "
-            leftName = getName(root.leftNode)
-            rightName = getName(root.rightNode)
-            graph.add_node(pydot.Node(name))
-            graph.add_node(pydot.Node(leftName))
-            graph.add_node(pydot.Node(rightName))
-            graph.add_edge(pydot.Edge(leftName, name))
-            graph.add_edge(pydot.Edge(rightName, name))
+            graph.add_node(pydot.Node(getName(nodes[0])))
 
     else:
-        while len(nodes) > 1:
-            # get last 2 letters
-            leastCommon = nodes.pop()
-            secondLeastCommon = nodes.pop()
-
+        # min-heap of (frequency, tiebreaker, node)
+        # the tiebreaker keeps the order deterministic and stops nodes being compared
+        heap = [(node.letter.freq, i, node) for i, node in enumerate(nodes)]
+        heapq.heapify(heap)
+        counter = len(heap)
+
+        while len(heap) > 1:
+            # get the 2 least common nodes
+            _, _, leastCommon = heapq.heappop(heap)
+            _, _, secondLeastCommon = heapq.heappop(heap)
+
+            # internal nodes have no char of their own, only the set of chars below them
             nodeLetter = Letter(
-                leastCommon.letter.char + secondLeastCommon.letter.char,
-                leastCommon.letter.freq + secondLeastCommon.letter.freq,
+                None, leastCommon.letter.freq + secondLeastCommon.letter.freq
             )
 
             # make a new node with the two letters
             node = Node(nodeLetter)
+            node.chars = leastCommon.chars | secondLeastCommon.chars
             node.hasChildNodes = True
             node.leftNode = leastCommon
             node.rightNode = secondLeastCommon
@@ -136,10 +150,10 @@ def makeTree(text: str, visualise: bool = False) -> Node:
                 graph.add_edge(pydot.Edge(rightName, name))
 
             # add it back in
-            nodes.append(node)
+            heapq.heappush(heap, (nodeLetter.freq, counter, node))
+            counter += 1
 
-            # sort
-            nodes.sort(reverse=True, key=lambda node: node.letter.freq)
+        nodes = [node for _, _, node in heap]
 
     # get first (hopefully only) element in nodes
     (tree,) = nodes
@@ -149,128 +163,505 @@ def makeTree(text: str, visualise: bool = False) -> Node:
     return tree
 
 
-def compress(text: str, tree: Node) -> str:
-    allBits = ""
-
-    for char in text:
-        node = tree
-        bits = ""
-
-        if char not in tree.letter.char:
+def makeCodeLengths(text: bytes) -> list[int]:
+    # work out the code length of each byte without building a tree, using
+    # Moffat and Katajainen's in-place algorithm on a list of the frequencies
+    # bytes that aren't in the text are left as 0
+    out = [0] * 256
+    counts = Counter(text)
+
+    # the letters from least to most common
+    letters = sorted(counts, key=lambda byte: (counts[byte], byte))
+    weights = [counts[byte] for byte in letters]
+    n = len(weights)
+
+    if n == 1:
+        # a single letter still needs a 1 bit code
+        out[letters[0]] = 1
+        return out
+
+    # first pass, make the internal nodes
+    # weights[i] becomes the weight of internal node i, then the index of its parent
+    root = 0
+    leaf = 0
+    for nextNode in range(n - 1):
+        # first child
+        if leaf >= n or (root < nextNode and weights[root] < weights[leaf]):
+            weights[nextNode] = weights[root]
+            weights[root] = nextNode
+            root += 1
+        else:
+            weights[nextNode] = weights[leaf]
+            leaf += 1
+
+        # second child
+        if leaf >= n or (root < nextNode and weights[root] < weights[leaf]):
+            weights[nextNode] += weights[root]
+            weights[root] = nextNode
+            root += 1
+        else:
+            weights[nextNode] += weights[leaf]
+            leaf += 1
+
+    # second pass, turn the parent indexes into the depth of each internal node
+    weights[n - 2] = 0
+    for nextNode in range(n - 3, -1, -1):
+        weights[nextNode] = weights[weights[nextNode]] + 1
+
+    # third pass, turn the internal node depths into the depth of each leaf
+    available = 1
+    used = 0
+    depth = 0
+    root = n - 2
+    nextNode = n - 1
+    while available > 0:
+        while root >= 0 and weights[root] == depth:
+            used += 1
+            root -= 1
+
+        while available > used:
+            weights[nextNode] = depth
+            nextNode -= 1
+            available -= 1
+
+        available = 2 * used
+        depth += 1
+        used = 0
+
+    for byte, length in zip(letters, weights):
+        out[byte] = length
+
+    return out
+
+
+def getCodeLengths(
+    node: Node, depth: int = 0, out: list[int] | None = None
+) -> list[int]:
+    # walk the tree once and record the depth of each byte, which is its code length
+    # bytes that aren't in the tree are left as 0
+    if out is None:
+        out = [0] * 256
+
+    if node.hasChildNodes:
+        getCodeLengths(node.leftNode, depth + 1, out)
+        getCodeLengths(node.rightNode, depth + 1, out)
+    else:
+        # a tree that is just one letter still needs a 1 bit code
+        out[node.letter.char] = max(depth, 1)
+
+    return out
+
+
+def getCanonicalCodes(codeLengths: bytes) -> list[tuple[int, int] | None]:
+    # assign canonical huffman codes (value, length) from the length of each code
+    # shorter codes come first, and codes of the same length are ordered by byte
+    # bytes that aren't in the tree are left as None
+    codes = [None] * 256
+    symbols = sorted(
+        (byte for byte in range(256) if codeLengths[byte]),
+        key=lambda byte: (codeLengths[byte], byte),
+    )
+
+    code = 0
+    prevLength = 0
+    for byte in symbols:
+        length = codeLengths[byte]
+        code <<= length - prevLength
+
+        # every code of this length has already been used
+        if code >> length:
             raise HuffmanException(
-                "Cannot compress character that is not in tree, "
-                f"got {char!r}, chars in tree {tree.letter.char!r}"
+                f"Malformed code lengths, too many codes of length {length}"
             )
 
-        while node.hasChildNodes:
-            if char in node.leftNode.letter.char:
-                node = node.leftNode
-                bits += "0"
+        codes[byte] = (code, length)
+        code += 1
+        prevLength = length
+
+    return codes
 
-            elif char in node.rightNode.letter.char:
-                node = node.rightNode
-                bits += "1"
 
-        allBits += bits
+def makeDecodeTree(codes: list[tuple[int, int] | None]) -> tuple:
+    # build nested (left, right) tuples with int leaves from the codes
+    # None is an empty leaf, where the codes don't fill the tree
+    root = [None, None]
 
-    return allBits
+    for byte, code in enumerate(codes):
+        if code is None:
+            continue
 
+        value, length = code
+        node = root
+        for shift in range(length - 1, 0, -1):
+            bit = (value >> shift) & 1
+            if node[bit] is None:
+                node[bit] = [None, None]
+            node = node[bit]
 
-def encode(bits: str, tree: Node) -> bytes:
-    output = b""
+        node[value & 1] = byte
 
-    treeAsJson = dumps(tree.asDict(), separators=(",", ":")).encode()
-    output += pack(">i", len(treeAsJson))
-    output += treeAsJson
+    def freeze(node: list | int | None) -> tuple | int | None:
+        if isinstance(node, list):
+            return freeze(node[0]), freeze(node[1])
+        return node
+
+    return freeze(root)
 
-    # encode the bits as chunks of 64 bits
 
-    chunks = [bits[i : i + 64] for i in range(0, len(bits), 64)]
-    output += pack(">Q", len(chunks))
+@lru_cache(maxsize=32)
+def makeEncoder(codeLengths: bytes) -> Callable[[bytes], tuple[bytes, int]]:
+    # make a function that compresses with the codes for these code lengths
+    # the codes are baked into the function and the bit packing is done inline,
+    # and encoders are cached so compressing with the same tree again reuses them
+    # compress has already checked that every byte of the text is in the table
+    table = tuple(getCanonicalCodes(codeLengths))
 
-    # loop through the chunks
-    for chunk in chunks:
-        # calculate the number of leading zeroes as this is lost when we convert to int
-        leadingZeroes = len(chunk) - len(chunk.lstrip("0"))
-        output += bytes([leadingZeroes])
-        output += pack(">Q", int(chunk, 2))
+    def encoder(text: bytes) -> tuple[bytes, int]:
+        output = bytearray()
+        # bits that haven't filled a whole 64 bit word yet
+        acc = 0
+        nbits = 0
+        total = 0
 
-    return output
+        for byte in text:
+            value, length = table[byte]
+            acc = (acc << length) | value
+            nbits += length
+            total += length
 
+            while nbits >= 64:
+                nbits -= 64
+                output += (acc >> nbits).to_bytes(8, "big")
+                acc &= (1 << nbits) - 1
 
-def decode(b: bytes) -> tuple[str, dict]:
-    fileobj = BytesIO(b)
+        # write out the remaining bits, padding the last byte with zeroes
+        if nbits:
+            noOfBytes = (nbits + 7) // 8
+            output += (acc << (noOfBytes * 8 - nbits)).to_bytes(noOfBytes, "big")
 
-    (treeLen,) = unpack(">i", fileobj.read(4))
-    tree = loads(fileobj.read(treeLen))
+        return bytes(output), total
 
-    (noOfChunks,) = unpack(">Q", fileobj.read(8))
+    return encoder
 
-    bits = ""
-    for _ in range(noOfChunks):
-        (leadingZeroes,) = fileobj.read(1)
 
-        # raise an exception if we have more than 64 leading zeroes in this chunk
-        # (max 64 because that's how long the chunks are)
-        if leadingZeroes not in range(0, 65):
-            raise HuffmanException(
-                f"Cannot have more that 64 leading zeroes in a chunk, got {leadingZeroes!r}"
-            )
+# how many bytes compressArray works on at once, to limit memory use
+CHUNK_SIZE = 1 << 16
+
+
+def compressArray(
+    text: bytes, codes: list[tuple[int, int] | None]
+) -> tuple[bytes, int]:
+    # compress using numpy, by looking up the bits of every byte's code at once
+    maxLength = max(length for _, length in filter(None, codes))
+
+    # the bits of each code left aligned in a row, and which of them are used
+    table = np.zeros((256, maxLength), dtype=np.uint8)
+    lengths = np.zeros(256, dtype=np.int64)
+    for byte, code in enumerate(codes):
+        if code is not None:
+            value, length = code
+            table[byte, :length] = [
+                (value >> shift) & 1 for shift in range(length - 1, -1, -1)
+            ]
+            lengths[byte] = length
+    used = np.arange(maxLength) < lengths[:, np.newaxis]
+
+    textArray = np.frombuffer(text, dtype=np.uint8)
+    output = bytearray()
+    noOfBits = 0
+    # bits left over from the last chunk that didn't fill a byte
+    leftover = np.zeros(0, dtype=np.uint8)
+
+    for start in range(0, len(textArray), CHUNK_SIZE):
+        chunk = textArray[start : start + CHUNK_SIZE]
+
+        # selecting with the mask keeps the bits in order
+        bits = np.concatenate((leftover, table[chunk][used[chunk]]))
+        noOfBits += len(bits) - len(leftover)
+
+        fullBytes = len(bits) // 8 * 8
+        output += np.packbits(bits[:fullBytes]).tobytes()
+        leftover = bits[fullBytes:]
+
+    # packbits pads the last byte with zeroes
+    output += np.packbits(leftover).tobytes()
+
+    return bytes(output), noOfBits
+
+
+# marks an empty leaf in the children array used by decodeBits
+EMPTY_LEAF = -257
+
 
-        (chunk,) = unpack(">Q", fileobj.read(8))
-        bits += ("0" * leadingZeroes) + bin(chunk)[2:]  # remove "0b" at start
+def encodeBits(text, codeValues, codeLengths, out) -> int:
+    # pack the code of each byte in text into out, returning the number of bits
+    # compiled with numba when it's installed, codes must be at most 56 bits long
+    acc = 0
+    nbits = 0
+    pos = 0
+    total = 0
 
-    return bits, tree
+    for byte in text:
+        length = codeLengths[byte]
+        acc = (acc << length) | codeValues[byte]
+        nbits += length
+        total += length
 
+        while nbits >= 8:
+            nbits -= 8
+            out[pos] = (acc >> nbits) & 0xFF
+            pos += 1
 
-def decompress(bits: str, tree: dict) -> str:
-    output = ""
-    curr = tree
+        acc &= (1 << nbits) - 1
 
-    for bit in bits:
-        # if a key is not 0 or 1, raise an exception
-        if (keys := list(curr.keys())) not in [["0", "1"], ["1", "0"]]:
-            raise HuffmanException(f"Malformed tree, keys should be 0 or 1, got {keys}")
+    # pad the last byte with zeroes
+    if nbits:
+        out[pos] = (acc << (8 - nbits)) & 0xFF
 
-        curr = curr.get(bit)
+    return total
+
+
+def decodeBits(data, noOfBits, children, out) -> int:
+    # walk the tree for each bit in data, returning the number of bytes put in out
+    # children[node] holds the next node for a 0 and a 1, with leaves as -(byte + 1)
+    # compiled with numba when it's installed
+    node = 0
+    pos = 0
+
+    for i in range(noOfBits):
+        node = children[node, (data[i >> 3] >> (7 - (i & 7))) & 1]
 
         # if we reached a character
-        if isinstance(curr, str):
-            output += curr
+        if node < 0:
+            if node == EMPTY_LEAF:
+                return -1
+
+            out[pos] = -node - 1
+            pos += 1
 
             # go back to the top
-            curr = tree
-            continue
+            node = 0
+
+    return pos
+
+
+if njit is not None:
+    encodeBits = njit(cache=True)(encodeBits)
+    decodeBits = njit(cache=True)(decodeBits)
+
+
+def compressJit(text: bytes, codes: list[tuple[int, int] | None]) -> tuple[bytes, int]:
+    # compress using the numba compiled encodeBits
+    codeValues = np.zeros(256, dtype=np.int64)
+    codeLengths = np.zeros(256, dtype=np.int64)
+    for byte, code in enumerate(codes):
+        if code is not None:
+            codeValues[byte], codeLengths[byte] = code
+
+    textArray = np.frombuffer(text, dtype=np.uint8)
+    out = np.zeros((int(codeLengths[textArray].sum()) + 7) // 8, dtype=np.uint8)
+    noOfBits = encodeBits(textArray, codeValues, codeLengths, out)
+
+    return out.tobytes(), noOfBits
+
+
+def compress(text: bytes, codeLengths: bytes) -> tuple[bytes, int]:
+    present = bytes(byte for byte in range(256) if codeLengths[byte])
+
+    # check every byte is in the tree once here, so the loops below don't have to
+    if missing := set(text).difference(present):
+        byte = next(byte for byte in text if byte in missing)
+        raise HuffmanException(
+            "Cannot compress byte that is not in tree, "
+            f"got {byte!r}, bytes in tree {present!r}"
+        )
+
+    # if there is only one letter with a 1 bit code each one is a 0 bit,
+    # so there's nothing to pack
+    if len(present) == 1 and codeLengths[present[0]] == 1:
+        return bytes((len(text) + 7) // 8), len(text)
+
+    codes = getCanonicalCodes(codeLengths)
+
+    # the accumulator in encodeBits is 64 bits so leave room for a partial byte
+    if njit is not None and max(length for _, length in filter(None, codes)) <= 56:
+        return compressJit(text, codes)
+
+    if np is not None:
+        return compressArray(text, codes)
+
+    return makeEncoder(codeLengths)(text)
+
+
+def encode(data: bytes, noOfBits: int, codeLengths: bytes) -> bytearray:
+    # allocate the whole output at once and fill it in
+    output = bytearray(HEADER_SIZE + len(data))
+
+    # the tree is stored as the code length of every byte (0 if it isn't in the tree)
+    # which is all that's needed to rebuild the canonical codes
+    output[:256] = codeLengths
+
+    # the total number of bits followed by the bits packed into bytes
+    pack_into(">Q", output, 256, noOfBits)
+    output[HEADER_SIZE:] = data
 
     return output
 
 
+def decode(fileobj: BinaryIO) -> tuple[memoryview, int, memoryview]:
+    # the header is the 256 code lengths followed by the number of bits
+    header = memoryview(fileobj.read(HEADER_SIZE))
+    if len(header) != HEADER_SIZE:
+        raise HuffmanException(
+            f"Expected {HEADER_SIZE} bytes of header, got {len(header)}"
+        )
+
+    codeLengths = header[:256]
+    (noOfBits,) = unpack_from(">Q", header, 256)
+    noOfBytes = (noOfBits + 7) // 8
+
+    # read the data into one buffer that is passed on without copying
+    data = bytearray(noOfBytes)
+    if (read := fileobj.readinto(data)) != noOfBytes:
+        raise HuffmanException(f"Expected {noOfBytes} bytes of data, got {read}")
+
+    return memoryview(data), noOfBits, codeLengths
+
+
+def decompressJit(
+    data: memoryview,
+    noOfBits: int,
+    codeLengths: memoryview,
+    states: list,
+    stateOf: dict,
+) -> bytes:
+    # decompress using the numba compiled decodeBits
+    children = np.zeros((len(states), 2), dtype=np.int64)
+    for state, node in enumerate(states):
+        for bit, child in enumerate(node):
+            if isinstance(child, tuple):
+                children[state, bit] = stateOf[id(child)]
+            elif child is None:
+                children[state, bit] = EMPTY_LEAF
+            else:
+                children[state, bit] = -child - 1
+
+    # there can't be more bytes than bits divided by the shortest code
+    minLength = min(filter(None, codeLengths), default=1)
+    out = np.zeros(noOfBits // minLength, dtype=np.uint8)
+
+    pos = decodeBits(np.frombuffer(data, dtype=np.uint8), noOfBits, children, out)
+    if pos < 0:
+        raise HuffmanException("Malformed data, reached an empty leaf")
+
+    return out[:pos].tobytes()
+
+
+def decompress(data: memoryview, noOfBits: int, codeLengths: memoryview) -> bytes:
+    # if there is only one letter with a 1 bit code every bit is that letter
+    present = [byte for byte in range(256) if codeLengths[byte]]
+    if len(present) == 1 and codeLengths[present[0]] == 1:
+        if bytes(data).strip(b"\0"):
+            raise HuffmanException("Malformed data, reached an empty leaf")
+
+        return bytes(present) * noOfBits
+
+    root = makeDecodeTree(getCanonicalCodes(codeLengths))
+
+    # number the internal nodes so they can be used as states when decoding bytes
+    states = []
+    stateOf = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, tuple):
+            stateOf[id(node)] = len(states)
+            states.append(node)
+            stack.extend(node)
+
+    if njit is not None:
+        return decompressJit(data, noOfBits, codeLengths, states, stateOf)
+
+    def step(node: tuple, byte: int, noOfBits: int) -> tuple[bytes, tuple]:
+        # walk the first noOfBits bits of byte starting from node
+        chars = []
+        for shift in range(7, 7 - noOfBits, -1):
+            node = node[(byte >> shift) & 1]
+
+            # if we reached a character
+            if isinstance(node, int):
+                chars.append(node)
+
+                # go back to the top
+                node = root
+
+            elif node is None:
+                raise HuffmanException("Malformed data, reached an empty leaf")
+
+        return bytes(chars), node
+
+    # (state << 8 | byte) -> (decoded chars, next state), filled in as bytes are seen
+    table = {}
+    output = []
+    append = output.append
+    state = 0
+
+    fullBytes, remainingBits = divmod(noOfBits, 8)
+    for byte in data[:fullBytes]:
+        key = state << 8 | byte
+        entry = table.get(key)
+
+        if entry is None:
+            chars, node = step(states[state], byte, 8)
+            entry = table[key] = chars, stateOf[id(node)]
+
+        chars, state = entry
+        append(chars)
+
+    # the last byte may be padded so only walk the bits that are there
+    if remainingBits:
+        chars, _ = step(states[state], data[fullBytes], remainingBits)
+        append(chars)
+
+    return b"".join(output)
+
+
 def main(args_list: list[str]) -> None:
     args = parser.parse_args(args_list)
 
     # set up the files to read from and write to
-    # if we are decompressing, we need to read in binary mode
-    stdin = sys.stdin.buffer if args.decompress else sys.stdin
-    inMode = "rb" if args.decompress else "r"
-    infile = open(args.infile, inMode) if args.infile else stdin
-
-    # if we are compressing, we need to write in binary mode
-    compressing = not args.decompress
-    stdout = sys.stdout.buffer if compressing else sys.stdout
-    outMode = "wb" if compressing else "w"
-    outfile = open(args.outfile, outMode) if args.outfile else stdout
-
-    with infile as file:
-        inText = file.read()
+    # both ways work on bytes so we always use binary mode
+    # stdin and stdout are already buffered so they are used as they are
+    infile = (
+        open(args.infile, "rb", buffering=BUFFER_SIZE)
+        if args.infile
+        else sys.stdin.buffer
+    )
+    outfile = (
+        open(args.outfile, "wb", buffering=BUFFER_SIZE)
+        if args.outfile
+        else sys.stdout.buffer
+    )
 
     if args.decompress:
-        bits, tree = decode(inText)
-        out = decompress(bits, tree)
+        # read straight from the file instead of reading it all first
+        with infile as file:
+            data, noOfBits, codeLengths = decode(file)
+
+        out = decompress(data, noOfBits, codeLengths)
 
     else:
-        tree = makeTree(inText, args.visualise)
-        bits = compress(inText, tree)
-        out = encode(bits, tree)
+        with infile as file:
+            inText = file.read()
+
+        # the tree is only needed to draw it, otherwise go straight to the code lengths
+        if args.visualise:
+            codeLengths = bytes(getCodeLengths(makeTree(inText, visualise=True)))
+        else:
+            codeLengths = bytes(makeCodeLengths(inText))
+
+        data, noOfBits = compress(inText, codeLengths)
+        out = encode(data, noOfBits, codeLengths)
 
     with outfile as file:
         file.write(out)